@@ -1,34 +1,245 @@
 #!/usr/bin/env python3
 """DeFi Protocol Dashboard — API proxy server with caching."""
 
+import codecs
+import gzip
+import hashlib
+import heapq
+import http.client
 import json
 import os
 import ssl
+import sys
+import threading
 import time
-import urllib.request
 import urllib.error
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import urllib.parse
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from functools import partial
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from operator import itemgetter
 
 PORT = 8000
 CACHE_TTL = 300  # 5 minutes
+CACHE_MAX_ENTRIES = 512
+CACHE_MAX_BYTES = 64 * 1024 * 1024  # encoded bodies, all variants included
+PREWARM_INTERVAL = CACHE_TTL - 30  # refresh hot endpoints before they expire
+SPARKLINE_WORKERS = 20  # one per protocol in the top-20 list
+COMPRESS_MIN_BYTES = 1024  # smaller bodies aren't worth a Content-Encoding
 STATIC_DIR = os.path.dirname(os.path.abspath(__file__))
+PROTOCOLS_URL = "https://api.llama.fi/protocols"
 
 # ---------------------------------------------------------------------------
 # In-memory cache
 # ---------------------------------------------------------------------------
-_cache: dict[str, dict] = {}
+# Fixed-shape record: a namedtuple is far smaller than a per-entry dict and
+# its fields are read by index rather than hashed.
+CacheEntry = namedtuple("CacheEntry", ["data", "variants", "ts"])
+
+# Bounded LRU: every /api/protocol/<slug> lands here, so without a cap the
+# dict would grow with each distinct slug ever requested. Slug bodies run to
+# several MB, so the bound is on stored bytes as well as entry count.
+_cache: OrderedDict[str, CacheEntry] = OrderedDict()
+_cache_lock = threading.Lock()
+
+# Keys whose decoded object is read back via cache_get; every other entry
+# keeps only its encoded bytes.
+CACHE_KEEP_DATA = frozenset({PROTOCOLS_URL})
+
+
+def cache_get_stale(key: str) -> tuple[CacheEntry | None, bool]:
+    """Return ``(entry, is_fresh)``; expired entries stay until evicted."""
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is None:
+            return None, False
+        _cache.move_to_end(key)
+    return entry, (time.monotonic() - entry.ts) < CACHE_TTL
 
 
 def cache_get(key: str):
-    entry = _cache.get(key)
-    if entry and (time.time() - entry["ts"]) < CACHE_TTL:
-        return entry["data"]
-    return None
+    """Return the decoded object for a fresh entry, or None on a miss.
+
+    Only keys in CACHE_KEEP_DATA retain their object, so asking for any other
+    key is a bug rather than a miss.
+    """
+    if key not in CACHE_KEEP_DATA:
+        raise KeyError(f"{key!r} is cached as bytes only; add it to CACHE_KEEP_DATA")
+    entry, fresh = cache_get_stale(key)
+    return entry.data if fresh else None
+
+
+def _variant(body: bytes, etag: str, encoding: str | None = None) -> tuple[str, bytes, bytes]:
+    """Build ``(etag, head, body)`` for one content-coding of a cached body.
+
+    ``head`` is the header block after the status/Date lines, prebuilt so a
+    cache hit is a single socket write with no per-request header formatting.
+    """
+    if encoding:
+        etag = '%s-%s"' % (etag[:-1], encoding)
+    head = (
+        b"Content-Type: application/json\r\n"
+        b"Content-Length: %d\r\n"
+        b"ETag: %s\r\n"
+        b"Vary: Accept-Encoding\r\n"
+        b"Access-Control-Allow-Origin: *\r\n" % (len(body), etag.encode("ascii"))
+    )
+    if encoding:
+        head += b"Content-Encoding: %s\r\n" % encoding.encode("ascii")
+    return etag, head + b"\r\n", body
+
+
+def cache_set(key: str, data) -> CacheEntry:
+    body = _dumps(data)
+    etag = '"%s"' % hashlib.blake2b(body, digest_size=8).hexdigest()
+    # Compressed variants are added by cache_variant on first request.
+    variants = {"identity": _variant(body, etag)}
+    if key not in CACHE_KEEP_DATA:
+        data = None  # served as bytes only; don't pin the parsed object graph
+    entry = CacheEntry(data, variants, time.monotonic())
+    with _cache_lock:
+        _cache[key] = entry
+        _cache.move_to_end(key)
+        # Re-total on every set: compressed variants are added lazily, and
+        # sets only happen on misses and refreshes.
+        total = sum(map(_entry_size, _cache.values()))
+        while len(_cache) > 1 and (total > CACHE_MAX_BYTES or len(_cache) > CACHE_MAX_ENTRIES):
+            _, evicted = _cache.popitem(last=False)
+            total -= _entry_size(evicted)
+    return entry
+
+
+def _entry_size(entry: CacheEntry) -> int:
+    # tuple() snapshots the dict in one step; cache_variant may add to it.
+    return sum(len(body) for _, _, body in tuple(entry.variants.values()))
+
+
+# Brotli is optional too; without it clients that accept gzip still get it.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+_COMPRESSORS = {"gzip": partial(gzip.compress, compresslevel=6)}
+if brotli is not None:
+    _COMPRESSORS["br"] = partial(brotli.compress, quality=4)
+
+
+def cache_variant(entry: CacheEntry, accept_encoding: str | None) -> tuple[str, bytes, bytes]:
+    """Pick the best ``(etag, head, body)`` variant the client accepts.
+
+    Each encoding is compressed the first time a client asks for it and then
+    reused for the rest of the entry's life, so passthrough bodies fetched
+    once per TTL never pay for codings nobody requests.
+    """
+    variants = entry.variants
+    etag, _, body = variants["identity"]
+    if len(body) >= COMPRESS_MIN_BYTES:
+        accepted = accepted_encodings(accept_encoding)
+        for encoding in ("br", "gzip"):
+            if encoding in accepted and encoding in _COMPRESSORS:
+                variant = variants.get(encoding)
+                if variant is None:
+                    compressed = _COMPRESSORS[encoding](body)
+                    variant = variants[encoding] = _variant(compressed, etag, encoding)
+                return variant
+    return variants["identity"]
+
+
+def accepted_encodings(accept_encoding: str | None) -> set[str]:
+    """Content-codings named in Accept-Encoding, minus any with q=0."""
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.partition(";")
+        q = params.strip().lower()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = (t.strip().removeprefix("W/") for t in if_none_match.split(","))
+    return any(t == etag or t == "*" for t in tags)
+
+
+# Single-flight: concurrent misses on the same key share one upstream fetch
+# instead of each hitting DefiLlama and parsing the same payload.
+_inflight: dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+
+def get_or_fetch(key: str, loader, timeout: float = 60, keep_stale: bool = False) -> CacheEntry:
+    """Run ``loader`` once for all concurrent callers, cache and return the entry.
+
+    With ``keep_stale``, an empty result leaves an existing entry in place
+    (and returns it) instead of overwriting it.
+    """
+    with _inflight_lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = _inflight[key] = Future()
+    if not leader:
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            raise UpstreamError("Timed out waiting for upstream") from None
+
+    try:
+        data = loader()
+        entry = cache_get_stale(key)[0] if keep_stale and not data else None
+        if entry is None:
+            entry = cache_set(key, data)
+    except BaseException as exc:
+        future.set_exception(exc)
+        raise
+    else:
+        future.set_result(entry)
+        return entry
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+
+
+# Stale-while-revalidate: an expired entry is still served while a background
+# worker refetches it, and it is only replaced if the refetch succeeds.
+_bg_pool = ThreadPoolExecutor(max_workers=4)
+_refreshing: set[str] = set()
+
+
+def _refresh(key: str, loader):
+    try:
+        # Through single-flight, so a cold miss racing the refresh (e.g. the
+        # first page load against the startup prewarm) shares its fetch.
+        get_or_fetch(key, loader, keep_stale=True)
+    except Exception:
+        pass
+    finally:
+        with _cache_lock:
+            _refreshing.discard(key)
+
+
+def _claim_refresh(key: str) -> bool:
+    with _cache_lock:
+        if key in _refreshing:
+            return False
+        _refreshing.add(key)
+        return True
 
 
-def cache_set(key: str, data):
-    _cache[key] = {"data": data, "ts": time.time()}
+def refresh_in_background(key: str, loader):
+    if _claim_refresh(key):
+        _bg_pool.submit(_refresh, key, loader)
 
 
 # ---------------------------------------------------------------------------
@@ -40,51 +251,290 @@ try:
 except ImportError:
     _ssl_ctx = ssl.create_default_context()
 
+# orjson is optional: it parses straight from bytes and serializes straight
+# to bytes, which speeds up the non-streamed upstreams (protocols, chains,
+# protocol detail) and every response encode. The yields feed is streamed
+# through iter_json_array instead and never touches it.
+try:
+    import orjson
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+except ImportError:
+    _loads = json.loads
+    # One reusable compact encoder; upstream JSON can't contain cycles, so
+    # the circular-reference bookkeeping is skipped too.
+    # ASCII output is kept so lone surrogates from upstream stay escaped.
+    _encode = json.JSONEncoder(separators=(",", ":"), check_circular=False).encode
+
+    def _dumps(obj) -> bytes:
+        return _encode(obj).encode("ascii")
+
+
+# Keep-alive connection pool, keyed by (scheme, host). Sparkline rebuilds hit
+# api.llama.fi twenty times in a row; reusing sockets skips a TCP + TLS
+# handshake on every fetch after the first. The idle cap matches the fan-out
+# width so a warm rebuild finds a socket for every concurrent fetch.
+POOL_MAX_IDLE = SPARKLINE_WORKERS
+# Same User-Agent urlopen sent; DefiLlama sits behind Cloudflare, which is
+# quick to block clients that send none.
+_UPSTREAM_HEADERS = {
+    "Accept": "application/json",
+    "User-Agent": "Python-urllib/%d.%d" % sys.version_info[:2],
+}
+_conn_pool: dict[tuple[str, str], list[http.client.HTTPConnection]] = {}
+_conn_pool_lock = threading.Lock()
+
+
+def _acquire_conn(scheme: str, host: str, timeout: float):
+    """Return ``(conn, reused)``, preferring an idle pooled connection."""
+    with _conn_pool_lock:
+        idle = _conn_pool.get((scheme, host))
+        conn = idle.pop() if idle else None
+    if conn is not None:
+        conn.sock.settimeout(timeout)
+        return conn, True
+    if scheme == "https":
+        return http.client.HTTPSConnection(host, timeout=timeout, context=_ssl_ctx), False
+    return http.client.HTTPConnection(host, timeout=timeout), False
+
+
+def _release_conn(scheme: str, host: str, conn: http.client.HTTPConnection):
+    with _conn_pool_lock:
+        idle = _conn_pool.setdefault((scheme, host), [])
+        if len(idle) < POOL_MAX_IDLE:
+            idle.append(conn)
+            return
+    conn.close()
+
+
+def _open_upstream(url: str, timeout: float, redirects: int = 5):
+    """GET ``url`` on a pooled connection; return ``(pool_key, conn, resp)``.
+
+    The response is 200 with its body still unread; hand the connection to
+    ``_finish_upstream`` once the body has been consumed.
+    """
+    parts = urllib.parse.urlsplit(url)
+    pool_key = (parts.scheme, parts.netloc)
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+
+    for attempt in range(2):
+        conn, reused = _acquire_conn(*pool_key, timeout)
+        try:
+            conn.request("GET", path, headers=_UPSTREAM_HEADERS)
+            resp = conn.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            conn.close()
+            if reused and attempt == 0:
+                continue  # server dropped an idle keep-alive socket; retry fresh
+            raise
+        except BaseException:
+            conn.close()
+            raise
+        break
+
+    if resp.status == 200:
+        return pool_key, conn, resp
+    try:
+        resp.read()
+    except BaseException:
+        conn.close()
+        raise
+    _finish_upstream(pool_key, conn, resp)
+    if resp.status in (301, 302, 303, 307, 308) and redirects:
+        location = urllib.parse.urljoin(url, resp.headers.get("Location", ""))
+        return _open_upstream(location, timeout, redirects - 1)
+    raise urllib.error.HTTPError(url, resp.status, resp.reason, resp.headers, None)
+
+
+def _finish_upstream(pool_key, conn, resp):
+    if resp.will_close:
+        conn.close()
+    else:
+        _release_conn(*pool_key, conn)
+
 
 def fetch_json(url: str, timeout: int = 30):
-    req = urllib.request.Request(url, headers={"Accept": "application/json"})
-    with urllib.request.urlopen(req, timeout=timeout, context=_ssl_ctx) as resp:
-        return json.loads(resp.read().decode("utf-8"))
+    pool_key, conn, resp = _open_upstream(url, timeout)
+    try:
+        body = resp.read()
+    except BaseException:
+        conn.close()
+        raise
+    _finish_upstream(pool_key, conn, resp)
+    return _loads(body)
+
+
+@contextmanager
+def fetch_stream(url: str, timeout: int = 30):
+    """Yield the unread upstream response for incremental parsing."""
+    pool_key, conn, resp = _open_upstream(url, timeout)
+    try:
+        yield resp
+        resp.read()  # drain whatever the parser didn't need
+    except BaseException:
+        conn.close()
+        raise
+    _finish_upstream(pool_key, conn, resp)
+
+
+_json_decoder = json.JSONDecoder()
+_NUMBER_CHARS = frozenset("0123456789+-.eE")
+
+
+class _JSONStream:
+    """Cursor over JSON text arriving in chunks from a binary stream."""
+
+    def __init__(self, stream, chunk_size: int):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        self.eof = not chunk
+        self.buf = self.buf[self.pos:] + self.decoder.decode(chunk, final=self.eof)
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character ('' at EOF)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\n\r":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, chars: str) -> str:
+        c = self.peek()
+        if not c or c not in chars:
+            raise json.JSONDecodeError(f"Expecting one of {chars!r}", self.buf, self.pos)
+        self.pos += 1
+        return c
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                obj, end = _json_decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            # A bare number cut by a read ("1." or "2e" at the buffer edge)
+            # decodes as its integer prefix, so only trust it once a
+            # non-number character follows.
+            if type(obj) in (float, int) and not self.eof:
+                tail = end
+                while tail < len(self.buf) and self.buf[tail] in _NUMBER_CHARS:
+                    tail += 1
+                if tail == len(self.buf):
+                    self.fill()
+                    continue
+            self.pos = end
+            return obj
+
+
+def iter_json_array(stream, key: str, chunk_size: int = 64 * 1024):
+    """Yield the items of ``obj[key]`` from a stream holding one JSON object.
+
+    Only the current item and one read chunk are held in memory, so a
+    multi-megabyte upstream body is never materialized as a whole.
+    """
+    js = _JSONStream(stream, chunk_size)
+    js.expect("{")
+    if js.peek() == "}":
+        return
+    while True:
+        name = js.value()
+        js.expect(":")
+        if name == key:
+            js.expect("[")
+            if js.peek() == "]":
+                return
+            while True:
+                yield js.value()
+                if js.expect(",]") == "]":
+                    return
+        js.value()
+        if js.expect(",}") == "}":
+            return
+
+
+class UpstreamError(Exception):
+    """Upstream failure whose message is safe to return to the client."""
+
+
+def fetch_transformed(url: str, transform=None):
+    data = fetch_json(url)
+    return transform(data) if transform else data
 
 
 # ---------------------------------------------------------------------------
 # Data transformers
 # ---------------------------------------------------------------------------
 
-YIELD_FIELDS = (
-    "pool", "project", "symbol", "chain",
-    "apy", "apyBase", "apyReward",
-    "tvlUsd", "stablecoin",
-)
-
 
 def transform_protocols(data: list) -> list:
     valid = [p for p in data
-             if isinstance(p.get("tvl"), (int, float))
+             if type(p.get("tvl")) in (float, int)
              and p.get("category") != "CEX"]
-    valid.sort(key=lambda p: p["tvl"], reverse=True)
-    return valid[:20]
+    return heapq.nlargest(20, valid, key=itemgetter("tvl"))
 
 
 def transform_chains(data: list) -> list:
-    valid = [c for c in data if isinstance(c.get("tvl"), (int, float))]
-    valid.sort(key=lambda c: c["tvl"], reverse=True)
+    valid = [c for c in data if type(c.get("tvl")) in (float, int)]
+    valid.sort(key=itemgetter("tvl"), reverse=True)
     return valid
 
 
-def transform_yields(data: dict) -> list:
-    pools = data.get("data", [])
-    filtered = [
-        {k: p.get(k) for k in YIELD_FIELDS}
-        for p in pools
-        if isinstance(p.get("tvlUsd"), (int, float))
-        and isinstance(p.get("apy"), (int, float))
-        and p["tvlUsd"] > 10_000
-        and 0 < p["apy"] < 1000
-        and not p.get("outlier")
+def _eligible_pools(pools):
+    for p in pools:
+        tvl = p.get("tvlUsd")
+        apy = p.get("apy")
+        # Exact type checks: JSON numbers are only ever float or int, and a
+        # pointer compare is much cheaper than isinstance in this loop.
+        t_tvl = type(tvl)
+        t_apy = type(apy)
+        if ((t_tvl is float or t_tvl is int) and (t_apy is float or t_apy is int)
+                and tvl > 10_000 and 0 < apy < 1000 and not p.get("outlier")):
+            yield p
+
+
+def transform_yields(pools) -> list:
+    """Top 100 pools by TVL; ``pools`` may be a lazily streamed iterable."""
+    # Rank the upstream dicts as-is and only build output rows for the
+    # winners, rather than allocating a row for every eligible pool.
+    top = heapq.nlargest(100, _eligible_pools(pools), key=itemgetter("tvlUsd"))
+    return [
+        {
+            "pool": p.get("pool"),
+            "project": p.get("project"),
+            "symbol": p.get("symbol"),
+            "chain": p.get("chain"),
+            "apy": p["apy"],
+            "apyBase": p.get("apyBase"),
+            "apyReward": p.get("apyReward"),
+            "tvlUsd": p["tvlUsd"],
+            "stablecoin": p.get("stablecoin"),
+        }
+        for p in top
     ]
-    filtered.sort(key=lambda p: p["tvlUsd"], reverse=True)
-    return filtered[:100]
+
+
+def fetch_yields(url: str) -> list:
+    # The pools endpoint is several MB and nearly all of it is filtered out,
+    # so parse it pool by pool instead of loading the whole document.
+    with fetch_stream(url) as resp:
+        return transform_yields(iter_json_array(resp, "data"))
 
 
 def transform_tvl_history(data: list) -> dict:
@@ -102,6 +552,15 @@ def transform_tvl_history(data: list) -> dict:
     }
 
 
+# Last good 7-day series per slug, so a transient upstream error for one
+# protocol doesn't blank its sparkline on the next rebuild.
+_sparkline_cache: dict[str, list[float]] = {}
+
+# Long-lived fan-out pool sized to the top-20 slug list, so every detail fetch
+# is in flight at once and no threads are spun up per rebuild.
+_sparkline_pool = ThreadPoolExecutor(max_workers=SPARKLINE_WORKERS)
+
+
 def build_sparklines(slugs: list[str]) -> dict[str, list[float]]:
     """Fetch last 7 days of TVL for each protocol slug in parallel."""
     result: dict[str, list[float]] = {}
@@ -117,20 +576,69 @@ def build_sparklines(slugs: list[str]) -> dict[str, list[float]]:
             pass
         return slug, []
 
-    with ThreadPoolExecutor(max_workers=10) as pool:
-        futures = {pool.submit(_fetch_one, s): s for s in slugs}
-        for fut in as_completed(futures):
-            slug, values = fut.result()
-            result[slug] = values
+    futures = [_sparkline_pool.submit(_fetch_one, s) for s in slugs]
+    for fut in as_completed(futures):
+        slug, values = fut.result()
+        if values:
+            _sparkline_cache[slug] = values
+        result[slug] = _sparkline_cache.get(slug, [])
 
     return result
 
 
+def load_sparklines() -> dict[str, list[float]]:
+    # Get protocol slugs (from cache, or shared with any in-flight fetch of
+    # /api/protocols)
+    protocols = cache_get(PROTOCOLS_URL)
+    if not protocols:
+        try:
+            protocols = get_or_fetch(PROTOCOLS_URL, CACHED_ROUTES["/api/protocols"][1]).data
+        except Exception as exc:
+            raise UpstreamError("Failed to fetch protocol list") from exc
+    return build_sparklines([p["slug"] for p in protocols])
+
+
+# Fixed-path JSON endpoints: path -> (cache key, loader). do_GET dispatches
+# these with one dict lookup instead of walking an if/elif chain.
+CACHED_ROUTES = {
+    "/api/protocols": (
+        PROTOCOLS_URL,
+        partial(fetch_transformed, PROTOCOLS_URL, transform_protocols),
+    ),
+    "/api/chains": (
+        "https://api.llama.fi/v2/chains",
+        partial(fetch_transformed, "https://api.llama.fi/v2/chains", transform_chains),
+    ),
+    "/api/yields": (
+        "yields",
+        partial(fetch_yields, "https://yields.llama.fi/pools"),
+    ),
+    "/api/sparklines": (
+        "sparklines",
+        load_sparklines,
+    ),
+    "/api/tvl-history": (
+        "tvl-history",
+        partial(fetch_transformed, "https://api.llama.fi/v2/historicalChainTvl", transform_tvl_history),
+    ),
+}
+
+
 # ---------------------------------------------------------------------------
 # Request handler
 # ---------------------------------------------------------------------------
 
+# Static files are read once and kept in memory; the mtime check picks up
+# edits to index.html without a restart.
+_static_cache: dict[str, tuple[int, bytes]] = {}
+
+
 class Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keep-alive lets the browser reuse one connection (and handler
+    # thread) for its burst of /api/* calls; every response sets
+    # Content-Length, and idle connections close after `timeout` seconds.
+    protocol_version = "HTTP/1.1"
+    timeout = 30
 
     def log_message(self, fmt, *args):
         # Quieter logs: just method + path + status
@@ -139,7 +647,7 @@ class Handler(BaseHTTPRequestHandler):
     # -- helpers ------------------------------------------------------------
 
     def send_json(self, data, status=200):
-        body = json.dumps(data).encode("utf-8")
+        body = _dumps(data)
         self.send_response(status)
         self.send_header("Content-Type", "application/json")
         self.send_header("Content-Length", str(len(body)))
@@ -147,98 +655,93 @@ class Handler(BaseHTTPRequestHandler):
         self.end_headers()
         self.wfile.write(body)
 
+    def send_cached(self, entry: CacheEntry):
+        etag, head, body = cache_variant(entry, self.headers.get("Accept-Encoding"))
+
+        if etag_matches(self.headers.get("If-None-Match"), etag):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Vary", "Accept-Encoding")
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            return
+        self.wfile.write(b"".join((
+            f"{self.protocol_version} 200 OK\r\n"
+            f"Server: {self.version_string()}\r\n"
+            f"Date: {self.date_time_string()}\r\n".encode("latin-1"),
+            head,
+            body,
+        )))
+
     def send_error_json(self, status, message):
         self.send_json({"error": message}, status)
 
     def serve_file(self, filepath, content_type):
         try:
-            with open(filepath, "rb") as f:
-                body = f.read()
-            self.send_response(200)
-            self.send_header("Content-Type", content_type)
-            self.send_header("Content-Length", str(len(body)))
-            self.end_headers()
-            self.wfile.write(body)
+            mtime = os.stat(filepath).st_mtime_ns
+            cached = _static_cache.get(filepath)
+            if cached and cached[0] == mtime:
+                body = cached[1]
+            else:
+                with open(filepath, "rb") as f:
+                    body = f.read()
+                _static_cache[filepath] = (mtime, body)
         except FileNotFoundError:
             self.send_error_json(404, "File not found")
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
 
     def proxy(self, upstream_url: str, transform=None, cache_key: str | None = None):
-        key = cache_key or upstream_url
-        cached = cache_get(key)
-        if cached is not None:
-            self.send_json(cached)
+        self.serve_cached(
+            cache_key or upstream_url,
+            partial(fetch_transformed, upstream_url, transform),
+        )
+
+    def serve_cached(self, key: str, loader):
+        entry, fresh = cache_get_stale(key)
+        if entry is not None:
+            if not fresh:
+                refresh_in_background(key, loader)
+            self.send_cached(entry)
             return
 
         try:
-            data = fetch_json(upstream_url)
-        except (urllib.error.URLError, urllib.error.HTTPError, TimeoutError) as exc:
+            entry = get_or_fetch(key, loader)
+        except UpstreamError as exc:
+            self.send_error_json(502, str(exc))
+            return
+        except (OSError, http.client.HTTPException) as exc:
             self.send_error_json(502, f"Upstream error: {exc}")
             return
-        except json.JSONDecodeError:
+        except ValueError:  # JSONDecodeError (json and orjson), UnicodeDecodeError
             self.send_error_json(502, "Invalid JSON from upstream")
             return
 
-        if transform:
-            data = transform(data)
-
-        cache_set(key, data)
-        self.send_json(data)
+        self.send_cached(entry)
 
     # -- routing ------------------------------------------------------------
 
     def do_GET(self):
-        path = self.path.split("?")[0].rstrip("/") or "/"
+        path = self.path.split("?", 1)[0].rstrip("/") or "/"
 
-        if path == "/":
-            self.serve_file(os.path.join(STATIC_DIR, "index.html"), "text/html; charset=utf-8")
+        route = CACHED_ROUTES.get(path)
+        if route:
+            self.serve_cached(*route)
 
-        elif path == "/api/protocols":
-            self.proxy("https://api.llama.fi/protocols", transform_protocols)
+        elif path == "/":
+            self.serve_file(os.path.join(STATIC_DIR, "index.html"), "text/html; charset=utf-8")
 
         elif path.startswith("/api/protocol/"):
-            slug = path.split("/api/protocol/", 1)[1]
+            slug = path[len("/api/protocol/"):]
             if not slug or "/" in slug:
                 self.send_error_json(400, "Invalid slug")
                 return
             self.proxy(f"https://api.llama.fi/protocol/{slug}")
 
-        elif path == "/api/chains":
-            self.proxy("https://api.llama.fi/v2/chains", transform_chains)
-
-        elif path == "/api/yields":
-            self.proxy(
-                "https://yields.llama.fi/pools",
-                transform_yields,
-                cache_key="yields",
-            )
-
-        elif path == "/api/sparklines":
-            cached = cache_get("sparklines")
-            if cached is not None:
-                self.send_json(cached)
-                return
-            # Get protocol slugs (from cache or fresh fetch)
-            protocols = cache_get("https://api.llama.fi/protocols")
-            if not protocols:
-                try:
-                    raw = fetch_json("https://api.llama.fi/protocols")
-                    protocols = transform_protocols(raw)
-                    cache_set("https://api.llama.fi/protocols", protocols)
-                except Exception:
-                    self.send_error_json(502, "Failed to fetch protocol list")
-                    return
-            slugs = [p["slug"] for p in protocols]
-            sparklines = build_sparklines(slugs)
-            cache_set("sparklines", sparklines)
-            self.send_json(sparklines)
-
-        elif path == "/api/tvl-history":
-            self.proxy(
-                "https://api.llama.fi/v2/historicalChainTvl",
-                transform_tvl_history,
-                cache_key="tvl-history",
-            )
-
         else:
             self.send_error_json(404, "Not found")
 
@@ -254,7 +757,26 @@ class Handler(BaseHTTPRequestHandler):
 # Main
 # ---------------------------------------------------------------------------
 
+def prewarm_forever():
+    """Refetch every fixed endpoint shortly before its entry expires.
+
+    The dashboard polls these on a loop, so keeping them warm means user
+    requests never wait on DefiLlama, and upstream load stays at one fetch
+    per endpoint per interval regardless of traffic.
+    """
+    while True:
+        # Schedule from the pass start so slow loads don't push later keys
+        # past CACHE_TTL.
+        next_pass = time.monotonic() + PREWARM_INTERVAL
+        # Dict order matters: protocols is warmed before sparklines reads it.
+        for key, loader in CACHED_ROUTES.values():
+            if _claim_refresh(key):
+                _refresh(key, loader)
+        time.sleep(max(0.0, next_pass - time.monotonic()))
+
+
 def main():
+    threading.Thread(target=prewarm_forever, daemon=True).start()
     server = ThreadingHTTPServer(("0.0.0.0", PORT), Handler)
     print(f"DeFi Dashboard running → http://0.0.0.0:{PORT}")
     try:
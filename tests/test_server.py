@@ -0,0 +1,176 @@
+import gzip
+import importlib.util
+import io
+import json
+import os
+import sys
+import threading
+import time
+import unittest
+import unittest.mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server  # noqa: E402
+
+
+STREAM_DOC = (
+    '{"status": "success", "count": 12.5, "ratio": -3e-2,\n'
+    ' "data": [1.5, 2e3, 3, -0.25, 1E+2, "Ünïcödé ✓ 🚀", true, null,\n'
+    '          {"pool": "é", "tvlUsd": 123456.789, "apy": 4.2e1, "tags": ["日本", 7]},\n'
+    '          []],\n'
+    ' "after": {"total": 98765.4321}, "tail": 42}'
+).encode("utf-8")
+
+
+class IterJsonArrayTest(unittest.TestCase):
+
+    def test_every_chunk_size(self):
+        expected = json.loads(STREAM_DOC)["data"]
+        for chunk_size in range(1, len(STREAM_DOC) + 1):
+            with self.subTest(chunk_size=chunk_size):
+                stream = io.BytesIO(STREAM_DOC)
+                items = list(server.iter_json_array(stream, "data", chunk_size=chunk_size))
+                self.assertEqual(items, expected)
+
+    def test_missing_key_yields_nothing(self):
+        stream = io.BytesIO(b'{"a": 1, "b": [2]}')
+        self.assertEqual(list(server.iter_json_array(stream, "data")), [])
+
+    def test_malformed_input_raises(self):
+        for raw in (b"[1, 2]", b'{"data": 5}', b'{"data": [1, 2', b'{"data": [1 2]}', b""):
+            with self.subTest(raw=raw):
+                with self.assertRaises(json.JSONDecodeError):
+                    list(server.iter_json_array(io.BytesIO(raw), "data", chunk_size=3))
+
+
+class StdlibDumpsTest(unittest.TestCase):
+    """The json fallback used when orjson isn't installed."""
+
+    @classmethod
+    def setUpClass(cls):
+        saved = sys.modules.get("orjson")
+        sys.modules["orjson"] = None  # makes `import orjson` raise ImportError
+        try:
+            spec = importlib.util.spec_from_file_location("server_no_orjson", server.__file__)
+            cls.module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(cls.module)
+        finally:
+            if saved is None:
+                del sys.modules["orjson"]
+            else:
+                sys.modules["orjson"] = saved
+
+    def test_compact_output(self):
+        self.assertEqual(self.module._dumps({"a": [1, "Ü"]}), b'{"a":[1,"\\u00dc"]}')
+
+    def test_lone_surrogate_is_escaped(self):
+        data = json.loads('["abc\\ud83d"]')
+        self.assertEqual(json.loads(self.module._dumps(data)), data)
+
+
+class CacheBoundsTest(unittest.TestCase):
+
+    def tearDown(self):
+        server._cache.clear()
+
+    def test_evicts_oldest_when_over_byte_budget(self):
+        payload = "x" * 400
+        size = len(server._dumps(payload))
+        with unittest.mock.patch.object(server, "CACHE_MAX_BYTES", size * 3):
+            for key in "abcd":
+                server.cache_set(key, payload)
+        self.assertEqual(list(server._cache), ["b", "c", "d"])
+
+    def test_decoded_data_kept_only_where_read_back(self):
+        self.assertIsNone(server.cache_set("https://api.llama.fi/protocol/aave", {"a": 1}).data)
+        self.assertEqual(server.cache_set(server.PROTOCOLS_URL, [{"slug": "aave"}]).data,
+                         [{"slug": "aave"}])
+
+    def test_cache_get_rejects_bytes_only_keys(self):
+        server.cache_set("https://api.llama.fi/v2/chains", [1])
+        with self.assertRaises(KeyError):
+            server.cache_get("https://api.llama.fi/v2/chains")
+        self.assertIsNone(server.cache_get(server.PROTOCOLS_URL))  # a real miss
+        server.cache_set(server.PROTOCOLS_URL, [{"slug": "aave"}])
+        self.assertEqual(server.cache_get(server.PROTOCOLS_URL), [{"slug": "aave"}])
+
+    def test_oversized_entry_is_still_kept_alone(self):
+        with unittest.mock.patch.object(server, "CACHE_MAX_BYTES", 10):
+            server.cache_set("a", [1])
+            server.cache_set("big", "x" * 100)
+        self.assertEqual(list(server._cache), ["big"])
+
+
+class CacheVariantTest(unittest.TestCase):
+
+    def tearDown(self):
+        server._cache.clear()
+
+    def test_compresses_on_first_accepting_request(self):
+        entry = server.cache_set("test-variant", [{"pool": str(i)} for i in range(200)])
+        self.assertEqual(set(entry.variants), {"identity"})
+
+        self.assertIs(server.cache_variant(entry, None), entry.variants["identity"])
+        self.assertEqual(set(entry.variants), {"identity"})
+
+        etag, head, body = server.cache_variant(entry, "gzip, deflate")
+        self.assertIn(b"Content-Encoding: gzip", head)
+        self.assertEqual(gzip.decompress(body), entry.variants["identity"][2])
+        self.assertIs(server.cache_variant(entry, "gzip"), entry.variants["gzip"])
+
+    def test_small_bodies_stay_uncompressed(self):
+        entry = server.cache_set("test-small", [1, 2, 3])
+        self.assertIs(server.cache_variant(entry, "gzip"), entry.variants["identity"])
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def tearDown(self):
+        server._cache.clear()
+
+    def test_refresh_and_cold_miss_share_one_fetch(self):
+        calls = []
+        release = threading.Event()
+
+        def loader():
+            calls.append(1)
+            release.wait(5)
+            return [1]
+
+        self.assertTrue(server._claim_refresh("k"))
+        refresher = threading.Thread(target=server._refresh, args=("k", loader))
+        refresher.start()
+        while "k" not in server._inflight:
+            time.sleep(0.001)
+        waiter = threading.Thread(target=server.get_or_fetch, args=("k", loader))
+        waiter.start()
+        release.set()
+        refresher.join()
+        waiter.join()
+        self.assertEqual(len(calls), 1)
+        with self.assertRaises(KeyError):
+            server.cache_get("k")  # "k" keeps bytes only
+        self.assertEqual(server.cache_get_stale("k")[0].variants["identity"][2], b"[1]")
+
+    def test_waiter_timeout_is_an_upstream_error(self):
+        release = threading.Event()
+        leader = threading.Thread(target=server.get_or_fetch, args=("slow", lambda: release.wait(5) and [1]))
+        leader.start()
+        while "slow" not in server._inflight:
+            time.sleep(0.001)
+        try:
+            with self.assertRaisesRegex(server.UpstreamError, "Timed out waiting for upstream"):
+                server.get_or_fetch("slow", list, timeout=0.01)
+        finally:
+            release.set()
+            leader.join()
+
+    def test_empty_refresh_keeps_existing_entry(self):
+        old = server.cache_set("k", [1])
+        self.assertIs(server.get_or_fetch("k", list, keep_stale=True), old)
+        self.assertIs(server.cache_get_stale("k")[0], old)
+
+
+if __name__ == "__main__":
+    unittest.main()